@@ -7,32 +7,62 @@ images.
 Last modified: 2023-02-21 16:24, on VSCode 1.75.1 with Python 3.11.0
 """
 
-import os, sys, time
-from PIL import Image
+import atexit, logging, logging.handlers, math, os, re, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps, __version__ as pil_version
+
+# Pillow-SIMD (a drop-in replacement of Pillow, with SSE4/AVX2 resizing) is
+# recommended; its versions carry a ".postN" tail, e.g. "9.0.0.post1".
+pil_simd = ".post" in pil_version
+
+
+# The running time is read only once, and its strings are formatted for the
+# log head, the log file name, and the album.
+run_time = time.localtime()
+run_time_full = time.strftime("%Y-%m-%d %H:%M:%S", run_time)
+run_date = time.strftime("%Y%m%d", run_time)
+run_date_wday = time.strftime("%Y-%m-%d, %a", run_time)
 
 
 # Log recording functions
 
-# global variables for log recording
-log_records = []    # type: list[str]   # store log records line (str) by line
-log_tag = True      # Ture (False): write program running log in .txt (or not)
+class StdoutHandler(logging.StreamHandler):
+    """
+    Prints log records to stdout, but leaves the flushing to the stdout buffer
+    (see Main Program), instead of flushing on each record.
+    """
+    def flush(self):
+        pass
 
-def show_log(
-    log_record: str,
-    ):
+
+# Program running info is recorded by this file's own logger: log() prints it
+# by default, even when the functions are used without main(), and (when
+# requested) writes it into the log file too, see set_log().
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(StdoutHandler(sys.stdout))
+logger.propagate = False    # not printed again by handlers of the root
+log = logger.info
+
+
+def set_log(log_tag: bool = True):
     """
-    Prints program running info and adds it to log_records at the same time.
+    Sets up the recording of program running info. The records are printed
+    to stdout; if log_tag is True, they are also held in a MemoryHandler until
+    set_log_file() gives it the log file, and then written 64 at a time.
     Parameters:
-        log_record: the running info to be printed and may be added into the
-                    global variable log_records, in order to form a .txt log
-                    file.    
+        log_tag:    True (False): write program running log in .txt (or not).
     Needs:
-        global variable log_records for recording log info;
-        global variable log_tag to clarify whether recording log info.
+        modulus logging.
+        global variable logger.
     """
-    print(log_record)
-    if log_tag:     # Only adds log_record when requested.
-        log_records.append(log_record + "\n")
+    for handler in logger.handlers[:]:  # drop those of a former set_log()
+        if isinstance(handler, logging.handlers.MemoryHandler):
+            logger.removeHandler(handler)
+    if log_tag:
+        # Never flushed by level; only by capacity when the file is given.
+        logger.addHandler(logging.handlers.MemoryHandler(
+            capacity=64, flushLevel=logging.CRITICAL + 1))
 
 
 def log_head(
@@ -41,6 +71,7 @@ def log_head(
     thumb_dir: str,
     thumb_size: tuple[int],
     thumb_ext: str,
+    log_tag: bool,
     ):
     """
     Recording log information at the start of the program.
@@ -48,51 +79,55 @@ def log_head(
         those needed for initializing program running; see the part parameters
         in section Main Program.
     Needs:
-        modulus time;
-        function show_log(), which requests global variables log_records,
-        log_tag
+        global variables run_time_full, pil_version, pil_simd;
+        function log().
     """
-    show_log(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()))
-    show_log("Format(s) of original images: " + str(img_exts)[1:-1])
-    show_log("Directory of original images: " + str(img_dir))
-    show_log("Directory of thumbnails: " + str(thumb_dir))
-    show_log("Thumbnail size (width, height): " + str(thumb_size)[1:-1])
-    show_log("Format of thumbnails: " + str(thumb_ext))
-    show_log("Form log file: " + str(log_tag) + "\n")
-
-
-def write_log(log_dir: str):
+    log(run_time_full)
+    log("Format(s) of original images: " + str(img_exts)[1:-1])
+    log("Directory of original images: " + str(img_dir))
+    log("Directory of thumbnails: " + str(thumb_dir))
+    log("Thumbnail size (width, height): " + str(thumb_size)[1:-1])
+    log("Format of thumbnails: " + str(thumb_ext))
+    log("Pillow version: " + pil_version +
+        (" (Pillow-SIMD)" if pil_simd else " (no SIMD resizing)"))
+    log("Form log file: " + str(log_tag) + "\n")
+
+
+def set_log_file(log_dir: str):
     """
-    Writes the log_records (i.e., program runnning information) into a text
-    log file (.txt). The log file will be named by the running time.
+    Lets the log records held by set_log(), and those to come, be written
+    into a text log file (.txt) in log_dir. The log file will be named by the
+    running time. Nothing is done if no log file was requested.
     Needs:
-        modulus os, sys, time.
-        global variable log_records for recording log info;
-        global variable log_tag to clarify whether the log info will be
-        written or not. 
+        modulus atexit, logging, os.
+        global variable logger;
+        global variable run_date for the log file name.
     """
-    log_name = time.strftime("%Y%m%d", time.localtime()) + ".txt"
-    log_path = os.path.join(log_dir, log_name)
-
-    if not log_tag:     # Exit function when no no log file is needed
+    for mem_handler in logger.handlers:
+        if isinstance(mem_handler, logging.handlers.MemoryHandler):
+            break
+    else:               # Exit function when no log file is needed
         return None
 
-    try:
-        with open(log_path, 'at', encoding='utf-8') as f_obj:
-            # When adding new contents to existing log file
-            if os.path.getsize(log_path) != 0:
-                f_obj.writelines("\n\n")    # two empty lines as log separater
+    log_name = run_date + ".txt"
+    log_path = os.path.join(log_dir, log_name)
 
-            f_obj.writelines(log_records)
+    try:
+        file_handler = logging.FileHandler(log_path, 'at', encoding='utf-8')
+        # When adding new contents to existing log file
+        if os.path.getsize(log_path) != 0:
+            file_handler.stream.write("\n\n")   # two empty lines as separater
 
-    # Abort when the file is not found.
+    # Stop holding records when the file cannot be accessed.
     except OSError:
         print("Cannot access log file '" + log_path + "'.")
+        logger.removeHandler(mem_handler)
+        return None
 
-    # Abort when it is not a text file, or the coding is wrong.
-    except UnicodeDecodeError:
-        print("Cannot accessss log file '" + log_path + ".\n" +
-              "Make sure it is an ASCII text file.")
+    mem_handler.setTarget(file_handler)
+    mem_handler.flush()
+    # Write the rest before logging closes the file handler at exit.
+    atexit.register(mem_handler.close)
 
 
 # Functional Section
@@ -107,27 +142,34 @@ def select_by_exts(
     Parameters:
         dir:    a string stores the path of the file directory.
         f_exts: the requested file extension (str), or a tuple containing the
-                requested file extensions. It will be used for str.endswith().
+                requested file extensions. It will be used for
+                bytes.endswith(), after os.fsencode().
     Needs:
         modulus os, sys.
     """
+    # Lower the requested extensions once, to ignore capital cases. Names
+    # are compared as bytes, which skips decoding every file name, and
+    # bytes.lower() is a plain ASCII table lookup.
+    if isinstance(f_exts, str):
+        f_exts = (f_exts,)
+    f_exts = tuple(os.fsencode(f_ext.lower()) for f_ext in f_exts)
+
+    # store the paths of sorted image files; DirEntry offers both the name
+    # and the path, and is_file() mostly needs no extra stat call. Only the
+    # paths selected are decoded back to str.
     try:
-        files = os.listdir(dir)
+        with os.scandir(os.fsencode(dir)) as entries:
+            f_paths = [os.fsdecode(entry.path) for entry in entries
+                       if entry.is_file()
+                       and entry.name.lower().endswith(f_exts)]
     except FileNotFoundError:   # When 'dir' cannot be accessed
-        show_log("Abort: cannot access the folder '" + dir + "'.\n")
+        log("Abort: cannot access the folder '" + dir + "'.\n")
         sys.exit(0)
-    
-    f_paths = []         # store the paths of sorted image files
-    for file in files:
-        # ignores capital cases in the file extensions
-        if file.lower().endswith(f_exts):
-            f_path = os.path.join(dir, file)
-            f_paths.append(f_path)
 
     if f_paths:
         return f_paths
     else:               # Abort when no file was found.
-        show_log("Abort: no qualified file is found.\n")
+        log("Abort: no qualified file is found.\n")
         sys.exit(0)
 
 
@@ -144,19 +186,29 @@ def mk_thumb_dir(
     Needs:
         modulus os, sys.
     """
-    img_dir_abs = os.path.abspath(img_dir)
-    thumb_dir_abs = os.path.abspath(thumb_dir)
-    if img_dir_abs == thumb_dir_abs:
-        show_log("Use the image dir for thumbnails.")
+    # Normalized paths tell the usual cases apart as strings. Only paths
+    # mixing absolute and relative forms, or going up (".."), need abspath(),
+    # which calls os.getcwd().
+    img_dir_norm = os.path.normpath(img_dir)
+    thumb_dir_norm = os.path.normpath(thumb_dir)
+    if img_dir_norm != thumb_dir_norm and (
+            os.path.isabs(img_dir_norm) != os.path.isabs(thumb_dir_norm) or
+            img_dir_norm.startswith(os.pardir) or
+            thumb_dir_norm.startswith(os.pardir)):
+        img_dir_norm = os.path.abspath(img_dir_norm)
+        thumb_dir_norm = os.path.abspath(thumb_dir_norm)
+
+    if img_dir_norm == thumb_dir_norm:
+        log("Use the image dir for thumbnails.")
         return None
     else:
         try:
             os.makedirs(thumb_dir, exist_ok=True)
         except:
-            show_log("Abort: cannot create directory " + thumb_dir_abs + "\n")
+            log("Abort: cannot create directory " + thumb_dir + "\n")
             sys.exit(0)
         else:
-            show_log("Make directory: " + thumb_dir_abs)
+            log("Make directory: " + thumb_dir)
 
 
 def mk_thumb_paths(
@@ -174,8 +226,7 @@ def mk_thumb_paths(
         thumb_tail: the file base tail of the thumbnails.
     Needs:
         modulus os.
-        function show_log(), which requests global variables log_records,
-        log_tag.
+        function log().
     Returns:
         a list of full paths (str) for thumbnails.
     PS. About the file name and path:
@@ -203,65 +254,96 @@ def crop_thumb(
     ) -> (str | None):
     """
     Crop from the center part of the original image (im_path) and create a
-    thumbnail (thumb_path) for that image. Will return the path of the image
-    if it cannot be accessed or processed, as well as when its thumbnail
-    cannot be saved.
+    thumbnail (thumb_path) for that image. Will return the reason if the image
+    cannot be accessed or processed, as well as when its thumbnail cannot be
+    saved. Nothing is logged here, so that it can run in worker processes.
     Parameters:
         im_path:    the path of the original image file.
         thumb_path: the thumbnail path.
         size:       a 2-tuple defines the thumbnail's (width, height).
     Needs:
-        class Image in modulus PIL.
+        class Image, ImageOps in modulus PIL.
     Returns:
-        im_path, if the thumbnail was not built;
+        a log record (str) on the failure, if the thumbnail was not built;
         None, if the thumbnail was successfully built.
     """
     try:
         img = Image.open(img_path)
     except FileNotFoundError:
-        show_log("File '" + img_path + "' cannot be not found.")
-        return img_path
+        return "File '" + img_path + "' cannot be not found."
     except:
-        show_log("File '" + img_path + "' cannot be processed.")
-        return img_path
-
-    img_w = img.width
-    img_h = img.height
-
-    # figure out the size tuple in order to crop to the largest size
-    w_ratio = size[0]/img_w
-    h_ratio = size[1]/img_h
-    if w_ratio == h_ratio:
-        crop_tuple = (0, 0, img_w, img_h)
-    elif w_ratio > h_ratio:
-        crop_w = img_w
-        crop_h = img_w*(size[1]/size[0])
-        crop_l_u = int((img_h - crop_h)/2)
-        crop_r_d = int((img_h - crop_h)/2 + crop_h)
-        crop_tuple = (0, crop_l_u, img_w, crop_r_d)
-    else:
-        crop_h = img_h
-        crop_w = img_h*(size[0]/size[1])
-        crop_l_u = int((img_w - crop_w)/2)
-        crop_r_d = int((img_w - crop_w)/2 + crop_w)
-        crop_tuple = (crop_l_u , 0, crop_r_d, img_h)
-    
-    cropped_img = img.crop(crop_tuple)
-    thumb_img = cropped_img.resize((size[0], size[1]))
+        return "File '" + img_path + "' cannot be processed."
+
+    # Image.open() only reads the file header. For JPEG files, let libjpeg
+    # decode at a reduced scale (1/2 ~ 1/8) that still covers twice the
+    # thumbnail size, before any pixel is accessed. The center crop is then
+    # worked out by ImageOps.fit() on the reduced size.
+    if img.format == 'JPEG':
+        img.draft('RGB', (size[0]*2, size[1]*2))
 
+    # Crop the largest center part with the thumbnail's aspect ratio and
+    # resize it, in one pass.
     try:
-        thumb_img.save(thumb_path)
+        thumb_img = ImageOps.fit(img, (size[0], size[1]),
+                                 Image.Resampling.LANCZOS,
+                                 centering=(0.5, 0.5))
     except:
-        show_log("File '" + thumb_path + "' cannot be saved.")
-        return img_path
+        return "File '" + img_path + "' cannot be processed."
+
+    try:
+        if thumb_path.lower().endswith(('.jpg', '.jpeg')):
+            # JPEG keeps no alpha or palette, so convert such thumbnails
+            # (small already) to RGB. Save with the fast baseline options and
+            # name the format, instead of guessing it from the extension.
+            if thumb_img.mode not in ('RGB', 'L'):
+                thumb_img = thumb_img.convert('RGB')
+            thumb_img.save(thumb_path, format='JPEG', quality=82,
+                           optimize=False, progressive=False,
+                           subsampling='4:2:0')
+        else:
+            thumb_img.save(thumb_path)
+    except:
+        return "File '" + thumb_path + "' cannot be saved."
     else:
         return None
 
 
+def crop_thumb_worker(
+    paths_size: tuple[str, str, tuple[int]],
+    ) -> str | None:
+    """
+    Unpacks the arguments for crop_thumb(), so that it can be mapped onto
+    worker processes. Returns what crop_thumb() returns, i.e., only the
+    failure record or None; the main process knows the paths already.
+    Needs:
+        function crop_thumb().
+    """
+    return crop_thumb(*paths_size)
+
+
+def thumb_up_to_date(
+    img_path: str,
+    thumb_path: str,
+    ) -> bool:
+    """
+    Tells whether the thumbnail (thumb_path) was modified no earlier than its
+    original image (img_path), i.e., it needs not to be made again. A missing
+    or unaccessible file counts as not up to date.
+    Needs:
+        modulus os.
+    """
+    try:
+        return os.stat(thumb_path).st_mtime >= os.stat(img_path).st_mtime
+    except OSError:
+        return False
+
+
 def mk_thumbs(
     img_paths: list[str],
     thumb_paths: str,
     thumb_size: tuple[int] = (200, 150),
+    max_workers: int | None = None,
+    force: bool = False,
     ) -> tuple[list, list]:
     """
     Makes thumbnails with the requsted extension (.jpg by default) for the
@@ -272,164 +354,323 @@ def mk_thumbs(
     Parameters:
         img_paths:  a list with of the paths (str) of original images.
         thumb_dir:  the folder to store the thumbnails.
+        max_workers: how many processes make thumbnails at the same time;
+                    None for os.cpu_count(). It is capped by the number of
+                    tasks (8 images each), and by 61 on Windows. Small jobs
+                    (< 4 images, or a single task) and max_workers == 1 run
+                    in the current process.
+        force:      True (False): make thumbnails again even if they are up
+                    to date (or keep them).
     Needs:
-        modulus os.
-        function crop_thumb().
+        modulus math, os, concurrent.futures.
+        function thumb_up_to_date(), crop_thumb_worker().
     """
-    tuple_imgs_thumbs = (
-        [], # type: list[str]   # stores the paths of original images
-        [], # type: list[str]   # stores the paths of corresponding thumbnails
-        )
-    
-    for index in range(len(img_paths)):
-        if crop_thumb(img_paths[index], thumb_paths[index], thumb_size):
-            show_log("Not processed:\t" + img_paths[index])
+    # Skip the images whose thumbnails are up to date, unless forced.
+    todo = [index for index in range(len(img_paths))
+            if force or not thumb_up_to_date(img_paths[index],
+                                             thumb_paths[index])]
+    jobs = [(img_paths[index], thumb_paths[index], thumb_size)
+            for index in todo]
+
+    # Never start more processes than tasks (chunks of 8 images); Windows
+    # accepts 61 processes at most.
+    n_workers = min(max_workers or os.cpu_count() or 1,
+                    math.ceil(len(jobs) / 8))
+    if os.name == 'nt':
+        n_workers = min(n_workers, 61)
+
+    if len(jobs) < 4 or n_workers <= 1:
+        results = list(map(crop_thumb_worker, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(crop_thumb_worker, jobs, chunksize=8))
+    fail_records = dict(zip(todo, results))
+
+    # Log in the main process, in the same order as img_paths, and keep the
+    # (image, thumbnail) pairs that are made or up to date.
+    done_pairs = []     # type: list[tuple[str, str]]
+    for index, img_thumb in enumerate(zip(img_paths, thumb_paths)):
+        if index not in fail_records:
+            log("Up to date:\t" + img_thumb[0])
+        elif fail_records[index] is None:
+            log("Processed:\t" + img_thumb[0])
         else:
-            show_log("Processed:\t" + img_paths[index])
-            tuple_imgs_thumbs[0].append(img_paths[index])
-            tuple_imgs_thumbs[1].append(thumb_paths[index])
-    
+            log(fail_records[index])
+            log("Not processed:\t" + img_thumb[0])
+            continue
+        done_pairs.append(img_thumb)
+
+    # Split the pairs into the list of the paths of original images, and
+    # the list of the paths of corresponding thumbnails.
+    if done_pairs:
+        tuple_imgs_thumbs = tuple(map(list, zip(*done_pairs)))
+    else:
+        tuple_imgs_thumbs = ([], [])
     return tuple_imgs_thumbs
         
 
+def album_page_names(
+    album_root: str,
+    album_ext: str,
+    n_pages: int,
+    ) -> list[str]:
+    """
+    Returns the file names of the album pages: the first page keeps the name
+    of the album file (album_root + album_ext), and page num (num >= 2) adds
+    a tail "_num" behind the file root, e.g., htm_album_2.htm.
+    """
+    page_names = [album_root + album_ext]
+    for page_num in range(2, n_pages + 1):
+        page_names.append(album_root + "_" + str(page_num) + album_ext)
+    return page_names
+
+
+def write_album_page(
+    page_path: str,
+    page_records: list[tuple[str, str, str, str]],
+    cell_tmpl: str,
+    album_raw_max: int,
+    total_imgs: int,
+    nav_bar: str = "",
+    ):
+    """
+    Writes one html page of the album, piece by piece into the page file.
+    Will raise OSError if the page file cannot be accessed, or UnicodeError
+    if a file name cannot be encoded.
+    Parameters:
+        page_path:      the path of the html page file.
+        page_records:   the records of the images on this page; see
+                        mk_htm_album().
+        cell_tmpl:      the template of a table (data) cell; see
+                        mk_htm_album().
+        album_raw_max:  how many thumbnails can be listed in a line.
+        total_imgs:     the number of images in the whole album.
+        nav_bar:        the html links to the other pages, if any.
+    Needs:
+        global variable run_date_wday for the creating date.
+    """
+    with open(page_path, 'wt', encoding='utf-8') as f_obj:
+        write = f_obj.write
+
+        # Add head content for the html file, using raw string.
+        write(R'''<html xmlns="http://www.w3.org/1999/xhtml">
+<head>
+<title>HTM Title</title>
+<meta http-equiv="content-type" content="text/html; charset=utf-8"/>
+<style type='text/css'>
+BODY  {color: #d0ffd0; background: #333333;
+       font-family: sans-serif; font-size: 14pt; margin: 8%}
+H1    {color: #d0ffd0}
+TABLE {text-align: center; margin-left: auto; margin-right: auto}
+TD    {color: #d0ffd0; padding: 1em}
+IMG   {border: 1px solid #d0ffd0}
+A     {color: #d0ffd0}
+</style>
+</head>
+<body>
+<h1>Album Title</h1><p>
+''')
+        write("<i>No. of images</i>: " + str(total_imgs) + "<br/>\n")
+        write("<i>Created on</i>:    " + run_date_wday + "</p>\n<hr\>\n")
+        write(nav_bar)
+
+        write("<table>\n")
+        # Add thumbnail and image links, one table line (raw) at a time.
+        page_imgs = len(page_records)
+        for raw_start in range(0, page_imgs, album_raw_max):
+            write("<tr>\n")                 # start a table line (raws)
+            raw_end = min(raw_start + album_raw_max, page_imgs)
+            for index in range(raw_start, raw_end):
+                # fill in a table (data) cell
+                rel_img, rel_thumb, img_base, thumb_path = page_records[index]
+                write(cell_tmpl.format(img=rel_img, thumb=rel_thumb,
+                                       alt=thumb_path, base=img_base))
+            write("</tr>\n")                # close a table line (raws)
+
+        write("</table>\n")
+        write(nav_bar)
+        write("</body>\n</html>\n")
+
+
 def mk_htm_album(
     tuple_imgs_thumbs: tuple[list],
     thumb_size: tuple[int],
     album_path: str = ".//htm_album.htm",
     album_raw_max: int = 3,
+    page_img_max: int = 1000,
     ) -> (str | None):
     """
     Generates the html album (image index) for the original images, using the
-    thumbnails generated.
+    thumbnails generated. An album with more than page_img_max images is
+    split into pages linked to each other: album_path holds the first page,
+    and the others are named by album_page_names().
     Needs:
-        modulus os, time.
+        modulus math, os, re.
+        function album_page_names(), write_album_page().
     Parameters:
         tuple_imgs_thumbs:  a 2-D tuple containing a list of the paths of
                             original imgages, and the list of the paths of
                             corresponding thumbnails created by mk_thumbs().
+                            The original images are in one folder, and so are
+                            the thumbnails.
         album_raw_max:      how many thumbnails can be listed in a line.
         album_path:         the path of the html album file. by default it is
                             htm_album.htm and is located under the current
                             directory.
+        page_img_max:       the maximum number of pictures per webpage.
     Returns:
         album_path      if the album file cannot be built.
         None            if the album file was successfully built.
     """
-    page_img_max = 1000     # set a limit on maximum picture per webpage
-
     total_imgs = len(tuple_imgs_thumbs[0])
-    if total_imgs > page_img_max:
-        show_log("Too many pictures (> 1000). No html album is made.\n")
-        return album_path
+    n_pages = max(1, math.ceil(total_imgs / page_img_max))
 
-    # Add head content for the html file, using raw string.
-    htm_cont = R'''<html xmlns="http://www.w3.org/1999/xhtml">
-<head>
-<title>HTM Title</title>
-<meta http-equiv="content-type" content="text/html; charset=utf-8"/>
-<style type='text/css'>
-BODY  {color: #d0ffd0; background: #333333;
-       font-family: sans-serif; font-size: 14pt; margin: 8%}
-H1    {color: #d0ffd0}
-TABLE {text-align: center; margin-left: auto; margin-right: auto}
-TD    {color: #d0ffd0; padding: 1em}
-IMG   {border: 1px solid #d0ffd0}
-</style>
-</head>
-<body>
-<h1>Album Title</h1><p>
-'''
-    htm_cont += (
-        "<i>No. of images</i>: " + str(total_imgs) + "<br/>\n"
-        )
-    htm_cont += ("<i>Created on</i>:    " +
-        time.strftime("%Y-%m-%d, %a", time.localtime()) + "</p>\n<hr\>\n"
-        )
-
-    htm_cont += "<table>\n"
-    # Add thumbnail and image links
-    for index in range(total_imgs):
-        raw = (index + 1) % album_raw_max
-        if raw == 1:                # start a table line (raws)
-            htm_cont += "<tr>\n"
-        
-        # fill in a table (data) cell
-        htm_cont += "<td align='center'>\n"
-
-        album_dir = os.path.dirname(album_path)
-        rel_img_path = os.path.relpath(tuple_imgs_thumbs[0][index],
-                                       album_dir)
-        rel_thumb_path = os.path.relpath(tuple_imgs_thumbs[1][index],
-                                         album_dir)
-
-        htm_cont += (
-            '<a href="' + rel_img_path + '">' +
-            '<img src="' +  rel_thumb_path + '" ' +
-                'width="' + str(thumb_size[0]) + '" ' +
-                'height="' + str(thumb_size[1]) + '" ' +
-            'alt="' + tuple_imgs_thumbs[1][index] + r'"/></a>' + '\n'
-            )
-        htm_cont += ("<div>" + os.path.basename(rel_img_path) + "</div>\n")
-        htm_cont += "</td>\n"       # close the table (data) cell
-
-        if (raw == album_raw_max) or (index == total_imgs):
-            htm_cont += "</tr>\n"   # close a table line (raws)
-
-    htm_cont += "</table>\n</body>\n</html>\n"
-
-    # Check if the album file is already there. If so, rename the target file
-    # by adding a tail "(num)" (num >= 1) behind the file root.
-    root_tail_num = 1   # type: int     # counting tag to avoid repeated name
-    file_exist_warning = False      # tag on whether warned the existing file
-
-    while os.path.exists(album_path):
-        if file_exist_warning == False:     # Warn there is a existing album,
-            show_log("Existing album file: " + album_path)
-            file_exist_warning = True       # and only warn that for one time.
-
-        album_path_root, album_path_ext = os.path.splitext(album_path)
-        root_tail = "(" + str(root_tail_num) + ")"
-
-        # Checks and removes old file root tail "(num)" to avoid repeated
-        # album names.
-        if album_path_root.endswith(root_tail):
-            album_path_root = album_path_root.removesuffix(root_tail)
+    # Check if the album files are already there. If so, rename the target
+    # files by adding a tail "(num)" (num >= 1) behind the file root. The
+    # names in the album folder are listed once, instead of a stat call per
+    # try; normcase() lets them match like paths do on Windows.
+    album_dir = os.path.dirname(album_path) or os.curdir
+    try:
+        with os.scandir(album_dir) as entries:
+            existing_names = {os.path.normcase(entry.name)
+                              for entry in entries}
+    except OSError:     # leave it to the writing below to report the folder
+        existing_names = set()
+
+    album_root, album_ext = os.path.splitext(os.path.basename(album_path))
+    page_names = album_page_names(album_root, album_ext, n_pages)
+    if any(os.path.normcase(name) in existing_names for name in page_names):
+        log("Existing album file: " + album_path)
+
+        # Removes old file root tail "(num)" to avoid repeated album names.
+        album_root = re.match(r"^(.*?)(?:\((\d+)\))?$", album_root).group(1)
+        root_tail_num = 1   # type: int     # counting tag to avoid repeats
+        while True:
+            page_names = album_page_names(
+                album_root + "(" + str(root_tail_num) + ")", album_ext, n_pages
+                )
+            if not any(os.path.normcase(name) in existing_names
+                       for name in page_names):
+                break
             root_tail_num += 1
-            
-        album_path = (
-            album_path_root + "(" + str(root_tail_num) + ")" + album_path_ext
-            )
 
-    # Write htm_cont into the album file.
-    try:
-        with open(album_path, 'wt', encoding='utf-8') as f_obj:
-            f_obj.write(htm_cont)
-    except:     # when the album file cannot be accessed
-        show_log("Cannot access album file: " + album_path)
-        return album_path
-    else:       # when album file successfully created
-        show_log("HTML album has been made: " + album_path)
+        album_path = os.path.join(os.path.dirname(album_path), page_names[0])
+
+    # All images (thumbnails) share a folder, so their relative folder to the
+    # album is figured out only once, as an url prefix ("" for the same one).
+    dir_prefixes = []   # type: list[str]   # for [images, thumbnails]
+    for paths in tuple_imgs_thumbs:
+        paths_dir = os.path.dirname(paths[0]) if paths else album_dir
+        rel_dir = os.path.relpath(paths_dir, album_dir)
+        if rel_dir == os.curdir:
+            dir_prefixes.append("")
+        else:
+            dir_prefixes.append(rel_dir.replace(os.sep, "/") + "/")
+    img_dir_rel, thumb_dir_rel = dir_prefixes
+
+    # Gather what a table cell needs into one record per image, i.e.,
+    # (image url, thumbnail url, image basename, thumbnail path).
+    records = []    # type: list[tuple[str, str, str, str]]
+    for img_path, thumb_path in zip(*tuple_imgs_thumbs):
+        img_base = os.path.basename(img_path)
+        records.append((img_dir_rel + img_base,
+                        thumb_dir_rel + os.path.basename(thumb_path),
+                        img_base, thumb_path))
+
+    # The thumbnail size is the same for every table (data) cell, so it is
+    # filled into the cell template once, leaving only the per image fields.
+    cell_tmpl = (
+        "<td align='center'>\n" +
+        '<a href="{img}"><img src="{thumb}" ' +
+            'width="' + str(thumb_size[0]) + '" ' +
+            'height="' + str(thumb_size[1]) + '" ' +
+        'alt="{alt}"/></a>\n' +
+        "<div>{base}</div>\n" +
+        "</td>\n"
+        )
+
+    # Write the html pages, each with page_img_max records at most.
+    for page_index in range(n_pages):
+        page_path = os.path.join(os.path.dirname(album_path),
+                                 page_names[page_index])
+
+        nav_bar = ""
+        if n_pages > 1:     # link to the previous and the next pages
+            nav_links = []
+            if page_index > 0:
+                nav_links.append(
+                    '<a href="' + page_names[page_index - 1] + '">prev</a>')
+            nav_links.append(
+                "Page " + str(page_index + 1) + " / " + str(n_pages))
+            if page_index < n_pages - 1:
+                nav_links.append(
+                    '<a href="' + page_names[page_index + 1] + '">next</a>')
+            nav_bar = "<p>" + " | ".join(nav_links) + "</p>\n"
+
+        page_records = records[page_index * page_img_max:
+                               (page_index + 1) * page_img_max]
+        try:
+            write_album_page(page_path, page_records, cell_tmpl,
+                             album_raw_max, total_imgs, nav_bar)
+        # when the album file cannot be accessed, or a name cannot be
+        # encoded; remove the pages written (the last one only partly).
+        except (OSError, UnicodeError):
+            log("Cannot access album file: " + page_path)
+            for page_name in page_names[:page_index + 1]:
+                try:
+                    os.remove(os.path.join(os.path.dirname(album_path),
+                                           page_name))
+                except OSError:
+                    pass
+            return album_path
+
+    # when album files successfully created
+    if n_pages > 1:
+        log("HTML album has been made: " + album_path +
+            " (" + str(n_pages) + " pages)")
+    else:
+        log("HTML album has been made: " + album_path)
 
 
 # Main Program
 
-# Parameters
-# The string of a file extension must begin with the dot (e.g., '.jpg').
-img_exts = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff')
-img_dir = ".\\photos"       # where the source/original image folder
-thumb_dir = os.path.join(img_dir, "thumbs")   # the album folder
-thumb_tail = "_thn"         # the file base tail of the thumbnails
-thumb_size = (128, 128)     # 2-D tuple contianing thumbnail width and height
-thumb_ext = '.jpg'          # thumbnail format
-album_path = os.path.join(img_dir, "htm_album.htm")     # the album file path
-album_raw_max = 4           # how many thumbnails can be listed in a line.       
-
-log_head(img_exts, img_dir, thumb_dir, thumb_size, thumb_ext)
-
-img_paths = select_by_exts(img_dir, img_exts)
-thumb_paths = mk_thumb_paths(img_paths, thumb_dir, thumb_ext, thumb_tail)
-mk_thumb_dir(img_dir, thumb_dir)
-tuple_imgs_thumbs = mk_thumbs(img_paths, thumb_paths, thumb_size)
-mk_htm_album(tuple_imgs_thumbs, thumb_size, album_path, album_raw_max)
-
-write_log(thumb_dir)
+def main():
+    """
+    Runs the program with the parameters below. Kept in a function, so that
+    worker processes importing this file (e.g., spawned on Windows and macOS)
+    do not run the program again.
+    Needs:
+        all functions above.
+    """
+    # Parameters
+    # The string of a file extension must begin with the dot (e.g., '.jpg').
+    img_exts = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff')
+    img_dir = ".\\photos"       # where the source/original image folder
+    thumb_dir = os.path.join(img_dir, "thumbs")   # the album folder
+    thumb_tail = "_thn"         # the file base tail of the thumbnails
+    thumb_size = (128, 128)     # 2-D tuple of thumbnail width and height
+    thumb_ext = '.jpg'          # thumbnail format
+    album_path = os.path.join(img_dir, "htm_album.htm")     # album file path
+    album_raw_max = 4           # how many thumbnails can be listed in a line.
+    max_workers = None          # processes making thumbnails; None: all CPUs
+    force_thumbs = False        # remake thumbnails even if up to date
+    log_tag = True              # True (False): write running log in .txt
+
+    # Buffer the running info printed, and only flush it at exit.
+    sys.stdout.reconfigure(line_buffering=False, write_through=False)
+    atexit.register(sys.stdout.flush)
+
+    set_log(log_tag)
+    log_head(img_exts, img_dir, thumb_dir, thumb_size, thumb_ext, log_tag)
+
+    img_paths = select_by_exts(img_dir, img_exts)
+    thumb_paths = mk_thumb_paths(img_paths, thumb_dir, thumb_ext, thumb_tail)
+    mk_thumb_dir(img_dir, thumb_dir)
+    set_log_file(thumb_dir)
+    tuple_imgs_thumbs = mk_thumbs(img_paths, thumb_paths, thumb_size,
+                                  max_workers, force_thumbs)
+    mk_htm_album(tuple_imgs_thumbs, thumb_size, album_path, album_raw_max)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,32 +5,61 @@
 # stored in a given folder.
 # Last modified: 2023-02-20 22:29
 
-import os, sys, time
-from PIL import Image
+import atexit, logging, logging.handlers, math, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps, __version__ as pil_version
+
+# Pillow-SIMD (a drop-in replacement of Pillow, with SSE4/AVX2 resizing) is
+# recommended; its versions carry a ".postN" tail, e.g. "9.0.0.post1".
+pil_simd = ".post" in pil_version
+
+
+# The running time is read only once, and its strings are formatted for the
+# log head and the log file name.
+run_time = time.localtime()
+run_time_full = time.strftime("%Y-%m-%d %H:%M:%S", run_time)
+run_date = time.strftime("%Y%m%d", run_time)
 
 
 # Log recording functions
 
-# global variables for log recording
-log_records = []    # type: list[str]   # store log records line (str) by line
-log_tag = True      # Ture (False): write program running log in .txt (or not)
+class StdoutHandler(logging.StreamHandler):
+    """
+    Prints log records to stdout, but leaves the flushing to the stdout buffer
+    (see Main Program), instead of flushing on each record.
+    """
+    def flush(self):
+        pass
 
-def show_log(
-    log_record: str,
-    ):
+
+# Program running info is recorded by this file's own logger: log() prints it
+# by default, even when the functions are used without main(), and (when
+# requested) writes it into the log file too, see set_log().
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(StdoutHandler(sys.stdout))
+logger.propagate = False    # not printed again by handlers of the root
+log = logger.info
+
+
+def set_log(log_tag: bool = True):
     """
-    Prints program running info and adds it to log_records at the same time.
+    Sets up the recording of program running info. The records are printed
+    to stdout; if log_tag is True, they are also held in a MemoryHandler until
+    set_log_file() gives it the log file, and then written 64 at a time.
     Parameters:
-        log_record: the running info to be printed and may be added into the
-                    global variable log_records, in order to form a .txt log
-                    file.    
+        log_tag:    True (False): write program running log in .txt (or not).
     Needs:
-        global variable log_records for recording log info;
-        global variable log_tag to clarify whether recording log info.
+        modulus logging.
+        global variable logger.
     """
-    print(log_record)
-    if log_tag:     # Only adds log_record when requested.
-        log_records.append(log_record + "\n")
+    for handler in logger.handlers[:]:  # drop those of a former set_log()
+        if isinstance(handler, logging.handlers.MemoryHandler):
+            logger.removeHandler(handler)
+    if log_tag:
+        # Never flushed by level; only by capacity when the file is given.
+        logger.addHandler(logging.handlers.MemoryHandler(
+            capacity=64, flushLevel=logging.CRITICAL + 1))
 
 
 def log_head(
@@ -39,6 +68,7 @@ def log_head(
     thumb_dir: str,
     thumb_size: tuple[int],
     thumb_ext: str,
+    log_tag: bool,
     ):
     """
     Recording log information at the start of the program.
@@ -46,51 +76,55 @@ def log_head(
         those needed for initializing program running; see the part parameters
         in section Main Program.
     Needs:
-        modulus time;
-        function show_log(), which requests global variables log_records,
-        log_tag
+        global variables run_time_full, pil_version, pil_simd;
+        function log().
     """
-    show_log(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()))
-    show_log("Format(s) of original images: " + str(img_exts)[1:-1])
-    show_log("Directory of original images: " + str(img_dir))
-    show_log("Directory of thumbnails: " + str(thumb_dir))
-    show_log("Thumbnail size (width, height): " + str(thumb_size)[1:-1])
-    show_log("Format of thumbnails: " + str(thumb_ext))
-    show_log("Form log file: " + str(log_tag) + "\n")
-
-
-def write_log(log_dir: str):
+    log(run_time_full)
+    log("Format(s) of original images: " + str(img_exts)[1:-1])
+    log("Directory of original images: " + str(img_dir))
+    log("Directory of thumbnails: " + str(thumb_dir))
+    log("Thumbnail size (width, height): " + str(thumb_size)[1:-1])
+    log("Format of thumbnails: " + str(thumb_ext))
+    log("Pillow version: " + pil_version +
+        (" (Pillow-SIMD)" if pil_simd else " (no SIMD resizing)"))
+    log("Form log file: " + str(log_tag) + "\n")
+
+
+def set_log_file(log_dir: str):
     """
-    Writes the log_records (i.e., program runnning information) into a text
-    log file (.txt). The log file will be named by the running time.
+    Lets the log records held by set_log(), and those to come, be written
+    into a text log file (.txt) in log_dir. The log file will be named by the
+    running time. Nothing is done if no log file was requested.
     Needs:
-        modulus os, sys, time.
-        global variable log_records for recording log info;
-        global variable log_tag to clarify whether the log info will be
-        written or not. 
+        modulus atexit, logging, os.
+        global variable logger;
+        global variable run_date for the log file name.
     """
-    log_name = time.strftime("%Y%m%d", time.localtime()) + ".txt"
-    log_path = os.path.join(log_dir, log_name)
-
-    if not log_tag:     # Exit function when no no log file is needed
+    for mem_handler in logger.handlers:
+        if isinstance(mem_handler, logging.handlers.MemoryHandler):
+            break
+    else:               # Exit function when no log file is needed
         return None
 
-    try:
-        with open(log_path, 'at', encoding='utf-8') as f_obj:
-            # When adding new contents to existing log file
-            if os.path.getsize(log_path) != 0:
-                f_obj.writelines("\n\n")    # two empty lines as log separater
+    log_name = run_date + ".txt"
+    log_path = os.path.join(log_dir, log_name)
 
-            f_obj.writelines(log_records)
+    try:
+        file_handler = logging.FileHandler(log_path, 'at', encoding='utf-8')
+        # When adding new contents to existing log file
+        if os.path.getsize(log_path) != 0:
+            file_handler.stream.write("\n\n")   # two empty lines as separater
 
-    # Abort when the file is not found.
+    # Stop holding records when the file cannot be accessed.
     except OSError:
         print("Cannot access log file '" + log_path + "'.")
+        logger.removeHandler(mem_handler)
+        return None
 
-    # Abort when it is not a text file, or the coding is wrong.
-    except UnicodeDecodeError:
-        print("Cannot accessss log file '" + log_path + ".\n" +
-              "Make sure it is an ASCII text file.")
+    mem_handler.setTarget(file_handler)
+    mem_handler.flush()
+    # Write the rest before logging closes the file handler at exit.
+    atexit.register(mem_handler.close)
 
 
 # Functional Section
@@ -105,27 +139,34 @@ def select_by_exts(
     Parameters:
         dir:    a string stores the path of the file directory.
         f_exts: the requested file extension (str), or a tuple containing the
-                requested file extensions. It will be used for str.endswith().
+                requested file extensions. It will be used for
+                bytes.endswith(), after os.fsencode().
     Needs:
         modulus os, sys.
     """
+    # Lower the requested extensions once, to ignore capital cases. Names
+    # are compared as bytes, which skips decoding every file name, and
+    # bytes.lower() is a plain ASCII table lookup.
+    if isinstance(f_exts, str):
+        f_exts = (f_exts,)
+    f_exts = tuple(os.fsencode(f_ext.lower()) for f_ext in f_exts)
+
+    # store the paths of sorted image files; DirEntry offers both the name
+    # and the path, and is_file() mostly needs no extra stat call. Only the
+    # paths selected are decoded back to str.
     try:
-        files = os.listdir(dir)
+        with os.scandir(os.fsencode(dir)) as entries:
+            f_paths = [os.fsdecode(entry.path) for entry in entries
+                       if entry.is_file()
+                       and entry.name.lower().endswith(f_exts)]
     except FileNotFoundError:   # When 'dir' cannot be accessed
-        show_log("Abort: cannot access the folder '" + dir + "'.\n")
+        log("Abort: cannot access the folder '" + dir + "'.\n")
         sys.exit(0)
-    
-    f_paths = []         # store the paths of sorted image files
-    for file in files:
-        # ignores capital cases in the file extensions
-        if file.lower().endswith(f_exts):
-            f_path = os.path.join(dir, file)
-            f_paths.append(f_path)
 
     if f_paths:
         return f_paths
     else:               # Abort when no file was found.
-        show_log("Abort: no qualified file is found.\n")
+        log("Abort: no qualified file is found.\n")
         sys.exit(0)
 
 
@@ -142,19 +183,29 @@ def mk_thumb_dir(
     Needs:
         modulus os, sys.
     """
-    img_dir_abs = os.path.abspath(img_dir)
-    thumb_dir_abs = os.path.abspath(thumb_dir)
-    if img_dir_abs == thumb_dir_abs:
-        show_log("Use the image dir for thumbnails.")
+    # Normalized paths tell the usual cases apart as strings. Only paths
+    # mixing absolute and relative forms, or going up (".."), need abspath(),
+    # which calls os.getcwd().
+    img_dir_norm = os.path.normpath(img_dir)
+    thumb_dir_norm = os.path.normpath(thumb_dir)
+    if img_dir_norm != thumb_dir_norm and (
+            os.path.isabs(img_dir_norm) != os.path.isabs(thumb_dir_norm) or
+            img_dir_norm.startswith(os.pardir) or
+            thumb_dir_norm.startswith(os.pardir)):
+        img_dir_norm = os.path.abspath(img_dir_norm)
+        thumb_dir_norm = os.path.abspath(thumb_dir_norm)
+
+    if img_dir_norm == thumb_dir_norm:
+        log("Use the image dir for thumbnails.")
         return None
     else:
         try:
-            os.makedirs(thumb_dir_abs, exist_ok=True)
+            os.makedirs(thumb_dir, exist_ok=True)
         except:
-            show_log("Abort: cannot create directory " + thumb_dir_abs + "\n")
+            log("Abort: cannot create directory " + thumb_dir + "\n")
             sys.exit(0)
         else:
-            show_log("Make directory: " + thumb_dir)
+            log("Make directory: " + thumb_dir)
 
 
 def mk_thumb_paths(
@@ -170,8 +221,7 @@ def mk_thumb_paths(
         thumb_ext:  the format/extension that will be used by thumbnails
     Needs:
         modulus os.
-        function show_log(), which requests global variables log_records,
-        log_tag.
+        function log().
     Returns:
         a list of full paths (str) for thumbnails.
     PS. About the file name and path:
@@ -185,7 +235,7 @@ def mk_thumb_paths(
     # Abort program when folders for original images and thumbnails are
     # actually the same one. 
     # if os.path.abspath(img_paths) == os.path.abspath(thumb_dir):
-    #     show_log("Abort: original images and thumbnails " +
+    #     log("Abort: original images and thumbnails " +
     #           "cannot be the same one.")
     #     sys.exit(0)
 
@@ -206,65 +256,96 @@ def crop_thumb(
     ) -> str | None:
     """
     Crop from the center part of the original image (im_path) and create a
-    thumbnail (thumb_path) for that image. Will return the path of the image
-    if it cannot be accessed or processed, as well as when its thumbnail
-    cannot be saved.
+    thumbnail (thumb_path) for that image. Will return the reason if the image
+    cannot be accessed or processed, as well as when its thumbnail cannot be
+    saved. Nothing is logged here, so that it can run in worker processes.
     Parameters:
         im_path:    the path of the original image file.
         thumb_path: the thumbnail path.
         size:       a 2-tuple defines the thumbnail's (width, height).
     Needs:
-        class Image in modulus PIL.
+        class Image, ImageOps in modulus PIL.
     Returns:
-        im_path, if the thumbnail was not built;
+        a log record (str) on the failure, if the thumbnail was not built;
         None, if the thumbnail was successfully built.
     """
     try:
         img = Image.open(img_path)
     except FileNotFoundError:
-        show_log("File '" + img_path + "' cannot be not found.")
-        return img_path
+        return "File '" + img_path + "' cannot be not found."
     except:
-        show_log("File '" + img_path + "' cannot be processed.")
-        return img_path
-
-    img_w = img.width
-    img_h = img.height
-
-    # figure out the size tuple in order to crop to the largest size
-    w_ratio = size[0]/img_w
-    h_ratio = size[1]/img_h
-    if w_ratio == h_ratio:
-        crop_tuple = (0, 0, img_w, img_h)
-    elif w_ratio > h_ratio:
-        crop_w = img_w
-        crop_h = img_w*(size[1]/size[0])
-        crop_l_u = int((img_h - crop_h)/2)
-        crop_r_d = int((img_h - crop_h)/2 + crop_h)
-        crop_tuple = (0, crop_l_u, img_w, crop_r_d)
-    else:
-        crop_h = img_h
-        crop_w = img_h*(size[0]/size[1])
-        crop_l_u = int((img_w - crop_w)/2)
-        crop_r_d = int((img_w - crop_w)/2 + crop_w)
-        crop_tuple = (crop_l_u , 0, crop_r_d, img_h)
-    
-    cropped_img = img.crop(crop_tuple)
-    thumb_img = cropped_img.resize((size[0], size[1]))
+        return "File '" + img_path + "' cannot be processed."
+
+    # Image.open() only reads the file header. For JPEG files, let libjpeg
+    # decode at a reduced scale (1/2 ~ 1/8) that still covers twice the
+    # thumbnail size, before any pixel is accessed. The center crop is then
+    # worked out by ImageOps.fit() on the reduced size.
+    if img.format == 'JPEG':
+        img.draft('RGB', (size[0]*2, size[1]*2))
 
+    # Crop the largest center part with the thumbnail's aspect ratio and
+    # resize it, in one pass.
     try:
-        thumb_img.save(thumb_path)
+        thumb_img = ImageOps.fit(img, (size[0], size[1]),
+                                 Image.Resampling.LANCZOS,
+                                 centering=(0.5, 0.5))
     except:
-        show_log("File '" + thumb_path + "' cannot be saved.")
-        return img_path
+        return "File '" + img_path + "' cannot be processed."
+
+    try:
+        if thumb_path.lower().endswith(('.jpg', '.jpeg')):
+            # JPEG keeps no alpha or palette, so convert such thumbnails
+            # (small already) to RGB. Save with the fast baseline options and
+            # name the format, instead of guessing it from the extension.
+            if thumb_img.mode not in ('RGB', 'L'):
+                thumb_img = thumb_img.convert('RGB')
+            thumb_img.save(thumb_path, format='JPEG', quality=82,
+                           optimize=False, progressive=False,
+                           subsampling='4:2:0')
+        else:
+            thumb_img.save(thumb_path)
+    except:
+        return "File '" + thumb_path + "' cannot be saved."
     else:
         return None
 
 
+def crop_thumb_worker(
+    paths_size: tuple[str, str, tuple[int]],
+    ) -> str | None:
+    """
+    Unpacks the arguments for crop_thumb(), so that it can be mapped onto
+    worker processes. Returns what crop_thumb() returns, i.e., only the
+    failure record or None; the main process knows the paths already.
+    Needs:
+        function crop_thumb().
+    """
+    return crop_thumb(*paths_size)
+
+
+def thumb_up_to_date(
+    img_path: str,
+    thumb_path: str,
+    ) -> bool:
+    """
+    Tells whether the thumbnail (thumb_path) was modified no earlier than its
+    original image (img_path), i.e., it needs not to be made again. A missing
+    or unaccessible file counts as not up to date.
+    Needs:
+        modulus os.
+    """
+    try:
+        return os.stat(thumb_path).st_mtime >= os.stat(img_path).st_mtime
+    except OSError:
+        return False
+
+
 def mk_thumbs(
     img_paths: list[str],
     thumb_paths: str,
     thumb_size: tuple[int] = (200, 150),
+    max_workers: int | None = None,
+    force: bool = False,
     ) -> tuple[list, list]:
     """
     Makes thumbnails with the requsted extension (.jpg by default) for the
@@ -275,41 +356,95 @@ def mk_thumbs(
     Parameters:
         img_paths:  a list with of the paths (str) of original images.
         thumb_dir:  the folder to store the thumbnails.
+        max_workers: how many processes make thumbnails at the same time;
+                    None for os.cpu_count(). It is capped by the number of
+                    tasks (8 images each), and by 61 on Windows. Small jobs
+                    (< 4 images, or a single task) and max_workers == 1 run
+                    in the current process.
+        force:      True (False): make thumbnails again even if they are up
+                    to date (or keep them).
     Needs:
-        modulus os.
-        function crop_thumb().
+        modulus math, os, concurrent.futures.
+        function thumb_up_to_date(), crop_thumb_worker().
     """
-    tuple_imgs_thumbs = (
-        [], # type: list[str]   # stores the paths of original images
-        [], # type: list[str]   # stores the paths of corresponding thumbnails
-        )
-    
-    for index in range(len(img_paths)):
-        if crop_thumb(img_paths[index], thumb_paths[index], thumb_size):
-            show_log("Not processed:\t" + img_paths[index])
+    # Skip the images whose thumbnails are up to date, unless forced.
+    todo = [index for index in range(len(img_paths))
+            if force or not thumb_up_to_date(img_paths[index],
+                                             thumb_paths[index])]
+    jobs = [(img_paths[index], thumb_paths[index], thumb_size)
+            for index in todo]
+
+    # Never start more processes than tasks (chunks of 8 images); Windows
+    # accepts 61 processes at most.
+    n_workers = min(max_workers or os.cpu_count() or 1,
+                    math.ceil(len(jobs) / 8))
+    if os.name == 'nt':
+        n_workers = min(n_workers, 61)
+
+    if len(jobs) < 4 or n_workers <= 1:
+        results = list(map(crop_thumb_worker, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(crop_thumb_worker, jobs, chunksize=8))
+    fail_records = dict(zip(todo, results))
+
+    # Log in the main process, in the same order as img_paths, and keep the
+    # (image, thumbnail) pairs that are made or up to date.
+    done_pairs = []     # type: list[tuple[str, str]]
+    for index, img_thumb in enumerate(zip(img_paths, thumb_paths)):
+        if index not in fail_records:
+            log("Up to date:\t" + img_thumb[0])
+        elif fail_records[index] is None:
+            log("Processed:\t" + img_thumb[0])
         else:
-            show_log("Processed:\t" + img_paths[index])
-            tuple_imgs_thumbs[0].append(img_paths[index])
-            tuple_imgs_thumbs[1].append(thumb_paths[index])
-    
+            log(fail_records[index])
+            log("Not processed:\t" + img_thumb[0])
+            continue
+        done_pairs.append(img_thumb)
+
+    # Split the pairs into the list of the paths of original images, and
+    # the list of the paths of corresponding thumbnails.
+    if done_pairs:
+        tuple_imgs_thumbs = tuple(map(list, zip(*done_pairs)))
+    else:
+        tuple_imgs_thumbs = ([], [])
     return tuple_imgs_thumbs
         
 
 # Main Program
 
-# Parameters
-# The string of a file extension must begin with the dot (e.g., '.jpg').
-img_exts = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff')
-img_dir = ".\\try"      # the source image folder
-thumb_dir = os.path.join(img_dir, "thumbs")   # the album folder
-thumb_size = (240, 180)
-thumb_ext = '.jpg'
-
-log_head(img_exts, img_dir, thumb_dir, thumb_size, thumb_ext)
-
-img_paths = select_by_exts(img_dir, img_exts)
-thumb_paths = mk_thumb_paths(img_paths, thumb_dir, thumb_ext)
-mk_thumb_dir(img_dir, thumb_dir)
-tuple_imgs_thumbs = mk_thumbs(img_paths, thumb_paths, thumb_size)
-
-write_log(thumb_dir)
+def main():
+    """
+    Runs the program with the parameters below. Kept in a function, so that
+    worker processes importing this file (e.g., spawned on Windows and macOS)
+    do not run the program again.
+    Needs:
+        all functions above.
+    """
+    # Parameters
+    # The string of a file extension must begin with the dot (e.g., '.jpg').
+    img_exts = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff')
+    img_dir = ".\\try"      # the source image folder
+    thumb_dir = os.path.join(img_dir, "thumbs")   # the album folder
+    thumb_size = (240, 180)
+    thumb_ext = '.jpg'
+    max_workers = None     # processes making thumbnails; None: all CPUs
+    force_thumbs = False   # remake thumbnails even if up to date
+    log_tag = True         # True (False): write running log in .txt (or not)
+
+    # Buffer the running info printed, and only flush it at exit.
+    sys.stdout.reconfigure(line_buffering=False, write_through=False)
+    atexit.register(sys.stdout.flush)
+
+    set_log(log_tag)
+    log_head(img_exts, img_dir, thumb_dir, thumb_size, thumb_ext, log_tag)
+
+    img_paths = select_by_exts(img_dir, img_exts)
+    thumb_paths = mk_thumb_paths(img_paths, thumb_dir, thumb_ext)
+    mk_thumb_dir(img_dir, thumb_dir)
+    set_log_file(thumb_dir)
+    mk_thumbs(img_paths, thumb_paths, thumb_size, max_workers, force_thumbs)
+
+
+if __name__ == "__main__":
+    main()